@@ -2,6 +2,8 @@ from __future__ import division, print_function
 import random
 
 from Player import Player
+import memo
+from history import GameHistory, PlayerHistory
 
 # Primary engine for the game simulation. You shouldn't need to edit
 # any of this if you're just testing strategies.
@@ -30,6 +32,11 @@ class GamePlayer(object):
         self.player = player
         self.food = food
         self.hunts = hunts
+        self.eliminated = None
+        self.history = PlayerHistory(parent.history, parent.history_rounds)
+        # Only fill in BasePlayer's placeholder, never a bot's own history
+        if getattr(player, 'history', 0) is None:
+            player.history = self.history.view
         
     @property
     def rep(self):
@@ -45,7 +52,7 @@ class GamePlayer(object):
     
 class Game(object):
     '''
-    Game(players, verbose=True, min_rounds=300, average_rounds=1000, end_early=False)
+    Game(players, verbose=True, min_rounds=300, average_rounds=1000, end_early=False, memoize=False, history_rounds=1000, seed=None)
     
     Primary game engine for the sim. players should be a list of players
     as defined in Player.py or bots.py. verbose determines whether the game
@@ -58,23 +65,45 @@ class Game(object):
     End_early is an option to allow you to better test your strategy.  If specified
     as True, the game will end if the 'Player' player is eliminated (in addition
     to ending if any of the other game end conditions are met).
+
+    memoize lets players that declare themselves pure (see Player.BasePlayer)
+    share cached decisions through memo.shared_cache. It is off by default
+    and only pays off for expensive pure strategies; none of the bots in
+    bots.py are marked pure.
+
+    history_rounds is how many past rounds the engine keeps in each
+    player's history buffers (see history.py).
+
+    seed, if given, gives the game its own random number generator for its
+    length, m and seating, so those replay exactly even when several games
+    are played at once. Bots that draw from the random module themselves
+    aren't covered; seed that yourself if you need them to replay too.
         
     Call game.play_game() to run the entire game at once, or game.play_round()
     to run one round at a time.
     
     See app.py for a bare-minimum test game.
     '''   
-    def __init__(self, players, verbose=True, min_rounds=300, average_rounds=1000, end_early=False):
+    def __init__(self, players, verbose=True, min_rounds=300, average_rounds=1000, end_early=False, memoize=False, history_rounds=1000, seed=None):
         self.verbose = verbose
         assert average_rounds > min_rounds, "average_rounds must be greater than min_rounds"
-        self.max_rounds = min_rounds + int(random.expovariate(1/(average_rounds-min_rounds)))
+        self.seed = seed
+        self.rng = random.Random(seed) if seed is not None else random
+        self.min_rounds = min_rounds
+        self.average_rounds = average_rounds
+        self.max_rounds = min_rounds + int(self.rng.expovariate(1/(average_rounds-min_rounds)))
         self.round = 0
         self.hunt_opportunities = 0
         self.end_early = end_early
+        self.decision_cache = memo.shared_cache if memoize else None
+        self.history_rounds = history_rounds
+        self.history = GameHistory(history_rounds)
         
         start_food = 300*(len(players)-1)
         
         self.players = [GamePlayer(self,p,start_food) for p in players]
+        # Unlike self.players, never shuffled or pruned
+        self.roster = list(self.players)
 
         if self.verbose:
             print("Game parameters:\n # players: %d\n verbose: %s\n " \
@@ -92,10 +121,22 @@ class Game(object):
         return len(self.players)
         
     def calculate_m(self):
-            return random.randrange(1, self.P*(self.P-1))
+            return self.rng.randrange(1, self.P*(self.P-1))
             
         
     def play_round(self):
+        m, requests = self.begin_round()
+        strategies = [self.hunt_choices(i, p, *args) for i, (p, args) in enumerate(zip(self.players, requests))]
+        self.finish_round(m, strategies)
+        
+        
+    def begin_round(self):
+        '''
+        First half of play_round: picks m, shuffles the players and returns
+        (m, requests) where requests[i] is the hunt_choices argument tuple
+        for self.players[i]. Split out so network.py can collect the
+        strategies asynchronously.
+        '''
         # Get beginning of round stats        
         self.round += 1
         if(self.verbose):
@@ -103,17 +144,32 @@ class Game(object):
         m = self.calculate_m()
         
         # Beginning of round setup
-        random.shuffle(self.players)
+        self.rng.shuffle(self.players)
         reputations = list(player.rep for player in self.players)
+        if self.decision_cache is not None:
+            self.round_decisions = self.decision_cache.round(reputations)
         
-        # Get player strategies
-        strategies = []
+        requests = []
         for i,p in enumerate(self.players):
             opp_reputations = reputations[:i]+reputations[i+1:]
-            strategy = p.player.hunt_choices(self.round, p.food, p.rep, m, opp_reputations)
-
+            requests.append((self.round, p.food, p.rep, m, opp_reputations))
+        return m, requests
+        
+        
+    def hunt_choices(self, i, p, *args):
+        '''Asks self.players[i] (that is, p) for its strategy this round'''
+        if self.decision_cache is not None:
+            return self.round_decisions.hunt_choices(i, p.player, *args)
+        return p.player.hunt_choices(*args)
+        
+        
+    def finish_round(self, m, strategies):
+        '''
+        Second half of play_round: strategies[i] is what self.players[i]
+        returned from hunt_choices. Raises StopIteration if the game is over.
+        '''
+        for i, strategy in enumerate(strategies):
             strategy.insert(i,'s')
-            strategies.append(strategy)
 
         # Perform the hunts
         self.hunt_opportunities += self.P-1
@@ -137,12 +193,14 @@ class Game(object):
             bonus = 0
         
         # Award food and let players run cleanup tasks
+        self.history.record(bonus, m, total_hunts)
         for strat, result, player in zip(strategies, results, self.players):
             food = sum(result)
             hunts = strat.count('h')
             
             player.food += food+bonus
             player.hunts += hunts
+            player.history.record(food, hunts)
             player.player.hunt_outcomes(result)
             player.player.round_end(bonus, m, total_hunts)
             
@@ -163,6 +221,7 @@ class Game(object):
         quit = False
 
         for p in starved:
+            p.eliminated = self.round
             print ("{} has starved and been eliminated in round {}".format(p.player, self.round))
 
             if isinstance(p.player, Player) and self.end_early:
@@ -184,14 +243,18 @@ class Game(object):
             try:
                 self.play_round()
             except StopIteration:
-                if len(self.players) <= 0:
-                    print ("Everyone starved")
-                elif (len(self.players) == 1):
-                    print ("The winner is: ", self.players[0].player)
-                else:
-                    survivors = sorted(self.players, key=lambda player: player.food, reverse=True)
-                    print ("The winner is: ", survivors[0].player)
-                    print ("Multiple survivors:")
-                    print (survivors)
+                self.announce_results()
                 break
+                
+                
+    def announce_results(self):
+        if len(self.players) <= 0:
+            print ("Everyone starved")
+        elif (len(self.players) == 1):
+            print ("The winner is: ", self.players[0].player)
+        else:
+            survivors = sorted(self.players, key=lambda player: player.food, reverse=True)
+            print ("The winner is: ", survivors[0].player)
+            print ("Multiple survivors:")
+            print (survivors)
         
@@ -14,8 +14,27 @@ class BasePlayer(object):
     '''
     Base class so I don't have to repeat bookkeeping stuff.
     Do not edit unless you're working on the simulation.
+
+    Set pure = True on a subclass whose hunt_choices is slow and depends only on
+    player_reputations (and on constructor arguments returned by
+    decision_key), and treats opponents with the same reputation alike.
+    With Game(..., memoize=True) the engine will then cache and share its
+    decisions. pure is not inherited: each class has to declare it itself.
+    Setting quantum to a small float like 0.01 additionally rounds the
+    reputations to that step before deciding, so more inputs share a
+    cache entry.
+
+    history is filled in by the engine with a history.HistoryView at the
+    start of each game. It holds fixed-size buffers of past awards, m,
+    number of hunters and this player's own results, so you don't need to
+    keep your own ever-growing lists. If your bot sets self.history to
+    something else itself, the engine leaves it alone.
     '''
     
+    pure = False
+    quantum = None
+    history = None
+    
     def __str__(self):
         try:
             return self.name
@@ -23,6 +42,10 @@ class BasePlayer(object):
             # Fall back on Python default
             return super(BasePlayer, self).__repr__()
     
+    def decision_key(self):
+        '''Everything besides the reputations that a pure strategy depends on'''
+        return type(self)
+    
     def hunt_choices(*args, **kwargs):
         raise NotImplementedError("You must define a strategy!")
         
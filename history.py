@@ -0,0 +1,157 @@
+from __future__ import division, print_function
+from array import array
+
+# Fixed-size round history kept by Game.py on behalf of the players, so
+# bots don't each need to store ever-growing lists of what happened.
+# Players reach it through self.history (see Player.BasePlayer), which
+# is a HistoryView: windows that hand out copies and keep the buffers
+# themselves out of reach.
+
+DEFAULT_CAPACITY = 1000
+
+
+class RingBuffer(object):
+    '''
+    RingBuffer(typecode, capacity)
+
+    Keeps the last capacity values appended, in a typed array (typecode as
+    in the array module). Every value is stored twice, capacity slots
+    apart, so the most recent n values always sit next to each other and
+    last(n) can hand out a read-only memoryview without copying. That's
+    for the engine only: the view's obj is the writable array.
+    '''
+    def __init__(self, typecode, capacity=DEFAULT_CAPACITY):
+        assert capacity > 0, "capacity must be positive"
+        self.capacity = capacity
+        self.data = array(typecode, [0]*(2*capacity))
+        self.start = 0
+        self.count = 0
+
+    def append(self, value):
+        end = (self.start + self.count) % self.capacity
+        self.data[end] = self.data[end + self.capacity] = value
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def last(self, n=None):
+        '''The most recent n values (all stored values if n is None), oldest first'''
+        if n is None:
+            n = self.count
+        elif n < 0:
+            raise ValueError("n must not be negative")
+        else:
+            n = min(n, self.count)
+        end = self.start + self.count
+        return memoryview(self.data)[end - n:end].toreadonly()
+
+    def sum(self, n=None):
+        return sum(self.last(n))
+
+    def mean(self, n=None):
+        window = self.last(n)
+        return sum(window)/len(window) if len(window) else 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.last()[index]
+
+    def __iter__(self):
+        return iter(self.last())
+
+
+class Window(object):
+    '''
+    Read-only face of a RingBuffer, which is what players get to see.
+    last(n) and slices return array copies, and the buffer is only held by
+    the closures behind the methods, so no attribute leads back to it.
+    '''
+    __slots__ = ('last', 'sum', 'mean', '_len')
+
+    def __init__(self, buffer):
+        typecode = buffer.data.typecode
+
+        def last(n=None):
+            '''The most recent n values (all stored values if n is None), oldest first'''
+            return array(typecode, buffer.last(n))
+        self.last = last
+        self.sum = lambda n=None: buffer.sum(n)
+        self.mean = lambda n=None: buffer.mean(n)
+        self._len = lambda: len(buffer)
+
+    def __len__(self):
+        return self._len()
+
+    def __getitem__(self, index):
+        return self.last()[index]
+
+    def __iter__(self):
+        return iter(self.last())
+
+
+class GameHistory(object):
+    '''
+    Public per-round history of one game: the award (bonus) paid out, m,
+    and the total number of hunters. Shared by all the players.
+    '''
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.awards = RingBuffer('l', capacity)
+        self.m = RingBuffer('l', capacity)
+        self.number_hunters = RingBuffer('l', capacity)
+
+    def record(self, award, m, number_hunters):
+        self.awards.append(award)
+        self.m.append(m)
+        self.number_hunters.append(number_hunters)
+
+
+class PlayerHistory(object):
+    '''
+    Engine side of one player's history: the shared GameHistory buffers
+    plus its own food earned from hunts (before the award) and number of
+    hunts per round. The player itself only gets view.
+    '''
+    def __init__(self, game_history, capacity=DEFAULT_CAPACITY):
+        self.game_history = game_history
+        self.earnings = RingBuffer('l', capacity)
+        self.hunts = RingBuffer('l', capacity)
+        self.view = HistoryView(self)
+
+    @property
+    def awards(self):
+        return self.game_history.awards
+
+    @property
+    def m(self):
+        return self.game_history.m
+
+    @property
+    def number_hunters(self):
+        return self.game_history.number_hunters
+
+    def record(self, earnings, hunts):
+        self.earnings.append(earnings)
+        self.hunts.append(hunts)
+
+
+class HistoryView(object):
+    '''
+    What a player sees as self.history. Every attribute is a Window:
+
+        self.history.awards.mean(100)    # mean award over the last 100 rounds
+        self.history.earnings.last(10)   # own hunt earnings, last 10 rounds
+
+    awards, m and number_hunters are shared by the whole game; earnings and
+    hunts are this player's own.
+    '''
+    __slots__ = ('awards', 'm', 'number_hunters', 'earnings', 'hunts')
+
+    def __init__(self, history):
+        self.awards = Window(history.awards)
+        self.m = Window(history.m)
+        self.number_hunters = Window(history.number_hunters)
+        self.earnings = Window(history.earnings)
+        self.hunts = Window(history.hunts)
@@ -0,0 +1,383 @@
+from __future__ import division, print_function
+from array import array
+import contextlib
+import io
+import math
+
+from Game import Game
+from bots import Pushover, Freeloader, Alternator, Random, FairHunter, \
+    BoundedHunter, AverageHunter
+
+# Approximate engine that follows expected values instead of drawing random
+# hunts. Good for quickly estimating how stochastic rosters (Random,
+# FairHunter, AverageHunter, ...) play out; use Game.py for the real thing.
+#
+# The approximation: every player hunts with opponent j with probability
+# q(rep_j, mean opponent rep), reputations are their expected values, and
+# food changes by its expected value each round. Since a player earns
+# -2 - [I hunt] + 3*[they hunt] from each pairing, expected food only
+# depends on those probabilities. The chance of the bonus is exact given
+# them: with m uniform on 1..N-1 (N = P*(P-1), see Game.calculate_m),
+# P(hunts >= m) = (E[hunts] - P(everyone hunts)) / (N-1).
+#
+# Players with the same model start alike and are treated alike, so they
+# stay alike: each round works on groups of identical players with their
+# counts, O(K^2) for K distinct models however big the roster.
+#
+# Game picks its length at random (see Game.__init__): it plays round t
+# with probability 1 up to round min_rounds+1 and exp(-(t-min_rounds-1)/mu)
+# after that, mu = average_rounds-min_rounds. Final results are averaged
+# over that distribution, using the expected state at each round.
+
+
+def hunt_model(player):
+    '''
+    hunt_model(player)
+
+    Returns (key, q): q(opponent_rep, average_rep) is the probability that
+    player hunts with an opponent, and players with equal keys share the
+    same q. Players outside bots.py can take part by defining a
+    hunt_probability(opponent_rep, average_rep) method; those are never
+    grouped, since their q may depend on anything.
+    '''
+    if hasattr(player, 'hunt_probability'):
+        return player, player.hunt_probability
+    if isinstance(player, Pushover):
+        return Pushover, lambda rep, avg: 1.0
+    if isinstance(player, Freeloader):
+        return Freeloader, lambda rep, avg: 0.0
+    if isinstance(player, Alternator):
+        # Alternates one decision at a time, so hunts half the time overall
+        return Alternator, lambda rep, avg: 0.5
+    if isinstance(player, Random):
+        p_hunt = player.p_hunt
+        return (Random, p_hunt), lambda rep, avg: p_hunt
+    if isinstance(player, FairHunter):
+        return FairHunter, lambda rep, avg: rep
+    if isinstance(player, AverageHunter):
+        return AverageHunter, lambda rep, avg: avg
+    if isinstance(player, BoundedHunter):
+        low, up = player.low, player.up
+        return (BoundedHunter, low, up), lambda rep, avg: 1.0 if low <= rep <= up else 0.0
+    raise ValueError("No mean-field model for {}; define hunt_probability".format(player))
+
+
+def normal_cdf(x):
+    return 0.5*(1 + math.erf(x/math.sqrt(2)))
+
+
+class MeanFieldGroup(object):
+    '''
+    Expected state of each of count identical players, plus its trajectory
+    so far. The trajectories hold the state after each round, assuming the
+    game got that far; expected_food, expected_rep and survival average
+    them over when the game ends.
+    '''
+    def __init__(self, parent, q, food):
+        self.parent = parent
+        self.q = q
+        self.count = 0
+        self.food = food
+        self.hunts = 0
+        self.variance = 0
+        self.eliminated = None
+        self.food_trajectory = array('d')
+        self.rep_trajectory = array('d')
+        self.survival_trajectory = array('d')
+
+    @property
+    def rep(self):
+        return self.hunts/self.parent.hunt_opportunities if self.parent.hunt_opportunities else 0
+
+    def expected(self, trajectory, after):
+        '''
+        Average of trajectory over the round the game ends in. after is the
+        value for rounds after this player was eliminated (None repeats the
+        last value).
+        '''
+        weights = self.parent.end_weights()
+        total = sum(w*v for w, v in zip(weights, trajectory))
+        if len(weights) > len(trajectory):
+            fill = trajectory[-1] if after is None else after
+            total += sum(weights[len(trajectory):])*fill
+        return total
+
+    @property
+    def expected_food(self):
+        '''Expected food when the game ends, counting starvation as 0'''
+        return self.expected([max(food, 0) for food in self.food_trajectory], 0.0)
+
+    @property
+    def expected_rep(self):
+        return self.expected(self.rep_trajectory, None)
+
+    @property
+    def survival(self):
+        '''Chance this player still has food when the game ends'''
+        return self.expected(self.survival_trajectory, 0.0)
+
+    def record(self):
+        self.food_trajectory.append(self.food)
+        self.rep_trajectory.append(self.rep)
+        if self.food <= 0:
+            survival = 0.0
+        elif not self.variance:
+            survival = 1.0
+        else:
+            # Normal approximation of the chance of still having food
+            survival = normal_cdf(self.food/math.sqrt(self.variance))
+        self.survival_trajectory.append(survival)
+
+
+class MeanFieldPlayer(object):
+    '''
+    One seat in a MeanFieldGame. Everything but player (food, rep,
+    eliminated, the trajectories, expected_food...) is read from its
+    MeanFieldGroup, which it shares with the players identical to it.
+    '''
+    def __init__(self, group, player):
+        self.group = group
+        self.player = player
+
+    def __getattr__(self, name):
+        return getattr(self.group, name)
+
+    def __repr__(self):
+        return '{} {:.1f} {:.3f}'.format(self.player, self.food, self.rep)
+
+
+class MeanFieldGame(object):
+    '''
+    MeanFieldGame(players, min_rounds=300, average_rounds=1000)
+
+    Expected-value counterpart of Game. Each round costs O(K^2) arithmetic
+    for K distinct kinds of player (see hunt_model), instead of O(P^2)
+    random draws plus the bots' own code, and the whole game is
+    deterministic, so a single run replaces averaging many Games.
+
+    min_rounds and average_rounds describe the random game length exactly
+    as in Game. play_game() runs until the chance of the game still going
+    drops below tail, and returns the players: expected_food, expected_rep
+    and survival average over when the game ends, and food_trajectory,
+    rep_trajectory and survival_trajectory hold the state round by round.
+    bonus_trajectory holds the chance of the bonus each round. Pass rounds
+    to play_game to make the game last exactly that long instead.
+
+    A player counts as eliminated once its expected food is no longer
+    positive.
+
+    See validate() to check how far it drifts from Game on a given roster.
+    '''
+    def __init__(self, players, min_rounds=300, average_rounds=1000):
+        assert average_rounds > min_rounds, "average_rounds must be greater than min_rounds"
+        self.min_rounds = min_rounds
+        self.average_rounds = average_rounds
+        self.round = 0
+        self.rounds = None
+        self.hunt_opportunities = 0
+        start_food = 300*(len(players)-1)
+        groups = {}
+        self.roster = []
+        for p in players:
+            key, q = hunt_model(p)
+            if key not in groups:
+                groups[key] = MeanFieldGroup(self, q, start_food)
+            groups[key].count += 1
+            self.roster.append(MeanFieldPlayer(groups[key], p))
+        self.groups = list(groups.values())
+        self.live = list(self.groups)
+        self.players = list(self.roster)
+        self.bonus_trajectory = array('d')
+
+    @property
+    def m_bonus(self):
+        return 2*(self.P-1)
+
+    @property
+    def P(self):
+        return len(self.players)
+
+    def still_playing(self, t):
+        '''Chance that round t gets played, if nobody gets eliminated'''
+        if self.rounds is not None:
+            return 1.0 if t <= self.rounds else 0.0
+        extra = t - self.min_rounds - 1
+        return 1.0 if extra <= 0 else math.exp(-extra/(self.average_rounds - self.min_rounds))
+
+    def end_weights(self):
+        '''
+        Chance of the game ending after each round played so far. Whatever
+        chance is left over goes to the last round.
+        '''
+        playing = [self.still_playing(t) for t in range(1, self.round + 2)]
+        weights = [playing[t] - playing[t+1] for t in range(self.round)]
+        if weights:
+            weights[-1] = playing[-2]
+        return weights
+
+    @property
+    def bonus_rate(self):
+        '''Expected share of the rounds played that paid the bonus'''
+        playing = [self.still_playing(t) for t in range(1, self.round + 1)]
+        if not playing:
+            return 0
+        return sum(w*b for w, b in zip(playing, self.bonus_trajectory))/sum(playing)
+
+    def bonus_probability(self, counts, hunt_probs):
+        '''
+        hunt_probs[k][l] is the chance a player in group k hunts with one
+        in group l; counts[k] is how many players group k has.
+        '''
+        everyone = 1.0
+        expected = 0.0
+        for k, row in enumerate(hunt_probs):
+            for l, a in enumerate(row):
+                pairs = counts[k]*(counts[l] - (k == l))
+                if pairs:
+                    everyone *= a**pairs
+                    expected += pairs*a
+        return (expected - everyone)/(self.P*(self.P-1) - 1)
+
+    def play_round(self):
+        self.round += 1
+        P = self.P
+        counts = [g.count for g in self.live]
+        reps = [g.rep for g in self.live]
+        total_rep = sum(c*r for c, r in zip(counts, reps))
+
+        # hunt_probs[k][l]: chance a player in group k hunts with one in
+        # group l (unused when k == l and the group has one player)
+        hunt_probs = []
+        for g, rep in zip(self.live, reps):
+            avg = (total_rep - rep)/(P-1)
+            hunt_probs.append([g.q(r, avg) for r in reps])
+        bonus_chance = self.bonus_probability(counts, hunt_probs)
+        self.bonus_trajectory.append(bonus_chance)
+
+        self.hunt_opportunities += P-1
+        bonus = self.m_bonus
+        for k, g in enumerate(self.live):
+            food = 0.0
+            variance = bonus*bonus*bonus_chance*(1-bonus_chance)
+            hunts = 0.0
+            for l, count in enumerate(counts):
+                opponents = count - (k == l)
+                if opponents:
+                    a, b = hunt_probs[k][l], hunt_probs[l][k]
+                    food += opponents*(-2 - a + 3*b)
+                    variance += opponents*(a*(1-a) + 9*b*(1-b))
+                    hunts += opponents*a
+            g.food += food + bonus*bonus_chance
+            g.variance += variance
+            g.hunts += hunts
+
+        for g in self.live:
+            g.record()
+        # As in Game, the starved keep their hunts but not their opportunities
+        for g in self.groups:
+            if g.eliminated is not None:
+                g.rep_trajectory.append(g.rep)
+
+        if self.game_over():
+            raise StopIteration
+
+    def game_over(self):
+        for g in self.live:
+            if g.food <= 0:
+                g.eliminated = self.round
+        self.live = [g for g in self.live if g.food > 0]
+        self.players = [p for p in self.players if p.food > 0]
+        return self.P < 2
+
+    def play_game(self, rounds=None, tail=1e-2):
+        '''
+        Runs until the game is unlikely (less than tail) to go on, or for
+        exactly rounds rounds if given, or until one player is left. The
+        chance left over is counted as ending on the last round played, so
+        tail bounds that error to tail times the change in the results over
+        the remaining rounds; the default 1e-2 is about 3,500 rounds at the
+        default lengths, against about 5,100 for 1e-3.
+        '''
+        self.rounds = rounds
+        try:
+            while self.still_playing(self.round + 1) >= tail:
+                self.play_round()
+        except StopIteration:
+            pass
+        return self.roster
+
+
+def validate(make_players, games=100, rounds=None, min_rounds=300, average_rounds=1000, verbose=True):
+    '''
+    validate(make_players, games=100, rounds=None, min_rounds=300, average_rounds=1000, verbose=True)
+
+    Compares MeanFieldGame with the average of games exact Games. By
+    default the Games pick their own random length, as usual; pass rounds
+    to play every Game (and the MeanFieldGame) for exactly that many
+    rounds instead. make_players is called for a fresh roster each game, eg.
+
+        validate(lambda: [Random(.3), FairHunter(), AverageHunter()])
+
+    Returns a dict with one row per roster position and the bonus rates;
+    food_drift is the largest gap in mean final food, as a fraction of
+    starting food. verbose prints the comparison.
+    '''
+    approx = MeanFieldGame(make_players(), min_rounds, average_rounds)
+    approx.play_game(rounds)
+
+    n = len(approx.roster)
+    food = [0.0]*n
+    rep = [0.0]*n
+    survived = [0]*n
+    bonuses = 0
+    played = 0
+    for _ in range(games):
+        players = make_players()
+        game = Game(players, verbose=False, min_rounds=min_rounds,
+                    average_rounds=average_rounds)
+        if rounds is not None:
+            game.max_rounds = rounds - 1
+        # Game announces eliminations even when quiet
+        with contextlib.redirect_stdout(io.StringIO()):
+            over = False
+            while not over:
+                try:
+                    game.play_round()
+                except StopIteration:
+                    over = True
+                bonuses += game.history.awards[-1] > 0
+        for i, seat in enumerate(game.roster):
+            food[i] += max(seat.food, 0)
+            rep[i] += seat.rep
+            survived[i] += seat.food > 0
+        played += game.round
+
+    rows = []
+    for i, p in enumerate(approx.roster):
+        rows.append({
+            'player': str(p.player),
+            'exact_food': food[i]/games,
+            'approx_food': p.expected_food,
+            'exact_rep': rep[i]/games,
+            'approx_rep': p.expected_rep,
+            'exact_survival': survived[i]/games,
+            'approx_survival': p.survival,
+        })
+    start_food = 300*(n-1)
+    report = {
+        'players': rows,
+        'exact_bonus_rate': bonuses/played,
+        'approx_bonus_rate': approx.bonus_rate,
+        'food_drift': max(abs(r['exact_food'] - r['approx_food']) for r in rows)/start_food,
+    }
+
+    if verbose:
+        print("{:<20} {:>10} {:>10} {:>7} {:>7} {:>7} {:>7}".format(
+            "player", "food", "approx", "rep", "approx", "alive", "approx"))
+        for r in rows:
+            print("{player:<20} {exact_food:>10.1f} {approx_food:>10.1f} "
+                  "{exact_rep:>7.3f} {approx_rep:>7.3f} "
+                  "{exact_survival:>7.2f} {approx_survival:>7.2f}".format(**r))
+        print("bonus rate {exact_bonus_rate:.3f} vs {approx_bonus_rate:.3f}, "
+              "food drift {food_drift:.1%} of starting food".format(**report))
+    return report
@@ -0,0 +1,148 @@
+from __future__ import division, print_function
+from collections import OrderedDict
+
+# Decision memoization for bots whose hunt_choices only depend on the
+# opponent reputations, used by Game(..., memoize=True). Looking up a
+# decision costs O(P) list work per seat plus a sort per round, so this
+# only helps strategies that cost much more than that to run.
+#
+# A pure bot (see Player.BasePlayer) treats opponents with equal
+# reputations alike, so its decisions are really a map from reputation to
+# 'h'/'s' that only depends on the multiset of reputations it was shown.
+# That lets one call serve every copy of the bot in a round: a copy in
+# another seat with the same reputation sees the same opponents, just
+# with itself and the original caller swapped.
+
+DEFAULT_MAX_ENTRIES = 4096
+
+
+def quantize(reputations, step):
+    '''
+    quantize(reputations, step)
+
+    Snap each reputation to the nearest multiple of step.
+    '''
+    return [round(rep/step)*step for rep in reputations]
+
+
+def is_pure(player):
+    '''
+    Only the class itself can declare purity, so a subclass that adds
+    state isn't cached by accident.
+    '''
+    return type(player).__dict__.get('pure', False)
+
+
+class DecisionCache(object):
+    '''
+    DecisionCache(max_entries=4096)
+
+    Bounded LRU cache of hunt decisions, one per player class, shared
+    across rounds and games. Entries are keyed on the player's
+    decision_key(), its own reputation and the sorted reputations of the
+    whole table, quantized first if the player sets quantum.
+
+    Call round(reputations) at the start of each round and ask the
+    returned RoundDecisions for each player's choices.
+    '''
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        assert max_entries > 0, "max_entries must be positive"
+        self.max_entries = max_entries
+        self.caches = {}
+        self.hits = 0
+        self.misses = 0
+
+    def round(self, reputations):
+        return RoundDecisions(self, reputations)
+
+    def lookup(self, player, key):
+        cache = self.caches.setdefault(type(player), OrderedDict())
+        try:
+            decisions = cache.pop(key)
+        except KeyError:
+            return None
+        cache[key] = decisions
+        return decisions
+
+    def store(self, player, key, decisions):
+        cache = self.caches.setdefault(type(player), OrderedDict())
+        if len(cache) >= self.max_entries:
+            cache.popitem(last=False)
+        cache[key] = decisions
+
+    def clear(self):
+        self.caches.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(len(cache) for cache in self.caches.values())
+
+
+class RoundDecisions(object):
+    '''
+    Decisions of the pure players for one round of one game. reputations
+    is the full list in seat order, as Game sees it; anything that isn't
+    pure is passed straight through to hunt_choices.
+    '''
+    def __init__(self, cache, reputations):
+        self.cache = cache
+        self.reputations = reputations
+        self.views = {}
+        self.shared = {}
+
+    def view(self, step):
+        '''The (possibly quantized) reputations and their sorted tuple'''
+        try:
+            return self.views[step]
+        except KeyError:
+            reps = quantize(self.reputations, step) if step else self.reputations
+            self.views[step] = (reps, tuple(sorted(reps)))
+            return self.views[step]
+
+    def hunt_choices(self, i, player, round_number, current_food,
+                     current_reputation, m, player_reputations):
+        if not is_pure(player):
+            return player.hunt_choices(round_number, current_food,
+                                       current_reputation, m,
+                                       player_reputations)
+
+        step = getattr(player, 'quantum', None)
+        reps, table = self.view(step)
+        group = (player.decision_key(), reps[i], step)
+
+        # full[j] is the decision against seat j, for the seat that
+        # computed it (whose own entry is a placeholder)
+        try:
+            seat, full = self.shared[group]
+            self.cache.hits += 1
+        except KeyError:
+            seat, full = i, self.compute(i, player, group + (table,), reps,
+                                         round_number, current_food,
+                                         current_reputation, m)
+            self.shared[group] = (seat, full)
+
+        decisions = list(full)
+        if seat != i:
+            # Seat i has the same reputation as seat, so seat gets the
+            # decision that was made against seat i
+            decisions[seat] = decisions[i]
+        del decisions[i]
+        return decisions
+
+    def compute(self, i, player, key, reps, *args):
+        by_rep = self.cache.lookup(player, key)
+        if by_rep is None:
+            self.cache.misses += 1
+            opponents = reps[:i] + reps[i+1:]
+            by_rep = dict(zip(opponents, player.hunt_choices(*args[:4] + (opponents,))))
+            self.cache.store(player, key, by_rep)
+        else:
+            self.cache.hits += 1
+        full = [by_rep.get(rep) for rep in reps]
+        full[i] = None
+        return full
+
+
+# Shared by every Game so that tournaments reuse decisions across games
+shared_cache = DecisionCache()
@@ -0,0 +1,343 @@
+from __future__ import division, print_function
+import asyncio
+import itertools
+import json
+
+from Player import BasePlayer
+
+# Runs many Games at once on one asyncio event loop with bots playing as
+# remote clients over TCP. Needs Python 3.8+. See LocalClient at the bottom
+# for a stand-in client that serves ordinary BasePlayer bots.
+#
+# Wire format: every line is a JSON list of messages, so a single write
+# carries everything queued for that client across all running games.
+#
+#   client -> server  [{"op": "hello", "bots": ["Pushover", ...]}]
+#   server -> client  {"op": "new", "seat": 3, "bot": "Pushover"}
+#                     {"op": "hunt_choices", "seat": 3, "id": 7, "args": [...]}
+#                     {"op": "hunt_outcomes", "seat": 3, "args": [...]}
+#                     {"op": "round_end", "seat": 3, "args": [...]}
+#                     {"op": "close", "seat": 3, "id": 8}
+#   client -> server  {"id": 7, "result": ["h", "s", ...]}
+#                     {"id": 8, "result": null}
+#                     {"id": 7, "error": "..."}
+#
+# A seat is one bot instance in one game. Only hunt_choices and close get a
+# reply; everything else is fire-and-forget and relies on the stream being
+# ordered. If a seat's bot raises, whatever the call, the client answers
+# that seat's next request with the error, so only that seat's game fails.
+# Replying to close is what catches a bot failing in the last round.
+
+
+class RemoteError(Exception):
+    '''A remote bot failed or broke the protocol.'''
+
+
+def encode(messages):
+    return (json.dumps(messages, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def decode(line):
+    return json.loads(line.decode('utf-8'))
+
+
+class Connection(object):
+    '''
+    Server side of one client socket. Messages are queued and written out
+    together once the event loop gets a chance to run, and replies are
+    matched back to their requests by id, so any number of requests from
+    any number of games can be in flight at once.
+    '''
+    def __init__(self, reader, writer, bots):
+        self.reader = reader
+        self.writer = writer
+        self.bots = bots
+        self.outbox = []
+        self.pending = {}
+        self.ids = itertools.count()
+        self.flusher = None
+        self.writes = 0
+        self.messages = 0
+
+    def send(self, message):
+        self.outbox.append(message)
+        if self.flusher is None:
+            self.flusher = asyncio.get_running_loop().create_task(self.write_outbox())
+
+    def request(self, message):
+        message['id'] = request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.send(message)
+        return future
+
+    async def write_outbox(self):
+        # The outbox can't grow without bound: each game waits for its
+        # replies before starting another round, so at most one round per
+        # game is ever queued. drain() keeps the socket buffer bounded too.
+        try:
+            # Let every game that is ready queue its messages first
+            await asyncio.sleep(0)
+            while self.outbox:
+                self.flush()
+                await self.writer.drain()
+        except ConnectionError:
+            # read_replies fails the pending requests
+            self.outbox = []
+        finally:
+            self.flusher = None
+
+    def flush(self):
+        if self.outbox and not self.writer.is_closing():
+            self.writes += 1
+            self.messages += len(self.outbox)
+            self.writer.write(encode(self.outbox))
+        self.outbox = []
+
+    async def read_replies(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                for reply in decode(line):
+                    future = self.pending.pop(reply['id'], None)
+                    if future is None or future.done():
+                        continue
+                    if 'error' in reply:
+                        future.set_exception(RemoteError(reply['error']))
+                    else:
+                        future.set_result(reply['result'])
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("client disconnected"))
+            self.pending.clear()
+
+
+class RemotePlayer(BasePlayer):
+    '''
+    Stands in for a bot living in a client process. Game treats it like any
+    other player, except that hunt_choices has to be collected through
+    request_hunt_choices by Server.play_game.
+    '''
+    seats = itertools.count()
+
+    def __init__(self, connection, bot):
+        self.connection = connection
+        self.name = bot
+        self.seat = next(RemotePlayer.seats)
+        connection.send({'op': 'new', 'seat': self.seat, 'bot': bot})
+
+    def hunt_choices(self, *args):
+        raise RemoteError("remote players must be run through network.Server")
+
+    async def request_hunt_choices(self, round_number, current_food,
+                                   current_reputation, m, player_reputations):
+        decisions = await self.connection.request(
+            {'op': 'hunt_choices', 'seat': self.seat,
+             'args': [round_number, current_food, current_reputation, m,
+                      player_reputations]})
+        # Game doesn't trust players, remote ones least of all
+        if (not isinstance(decisions, list)
+                or len(decisions) != len(player_reputations)
+                or any(d not in ('h', 's') for d in decisions)):
+            raise RemoteError("{} sent invalid decisions: {!r}".format(self, decisions))
+        return decisions
+
+    def hunt_outcomes(self, food_earnings):
+        self.connection.send({'op': 'hunt_outcomes', 'seat': self.seat,
+                              'args': [food_earnings]})
+
+    def round_end(self, award, m, number_hunters):
+        self.connection.send({'op': 'round_end', 'seat': self.seat,
+                              'args': [award, m, number_hunters]})
+
+    def close(self, wait=True):
+        '''
+        Frees the seat. With wait, returns a future that fails if the bot
+        raised since its last hunt_choices; otherwise nobody waits to hear.
+        '''
+        message = {'op': 'close', 'seat': self.seat}
+        if wait:
+            return self.connection.request(message)
+        self.connection.send(message)
+
+
+class Server(object):
+    '''
+    Server(host='127.0.0.1', port=0)
+
+    Accepts bot clients and runs Games whose players may be RemotePlayers.
+    Typical use, inside a coroutine:
+
+        server = Server()
+        await server.start()
+        await server.wait_for_bots(['Pushover'])
+        games = [Game([server.remote_player('Pushover'), Freeloader()], verbose=False)
+                 for _ in range(100)]
+        await server.play_games(games)
+
+    port=0 picks a free port; the real one is in server.port after start().
+    '''
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.connections = []
+        self.bots = {}
+        self.server = None
+        self.registered = None
+
+    async def start(self):
+        self.registered = asyncio.Condition()
+        self.server = await asyncio.start_server(self.accept, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        for connection in self.connections:
+            connection.flush()
+            connection.writer.close()
+        await self.server.wait_closed()
+
+    async def accept(self, reader, writer):
+        hello = decode(await reader.readline())[0]
+        connection = Connection(reader, writer, hello['bots'])
+        self.connections.append(connection)
+        async with self.registered:
+            for bot in connection.bots:
+                self.bots.setdefault(bot, connection)
+            self.registered.notify_all()
+        try:
+            await connection.read_replies()
+        finally:
+            self.connections.remove(connection)
+            for bot in connection.bots:
+                if self.bots.get(bot) is connection:
+                    del self.bots[bot]
+
+    async def wait_for_bots(self, bots):
+        async with self.registered:
+            await self.registered.wait_for(lambda: all(b in self.bots for b in bots))
+
+    def remote_player(self, bot):
+        try:
+            connection = self.bots[bot]
+        except KeyError:
+            raise RemoteError("no client has registered a bot called {}".format(bot))
+        return RemotePlayer(connection, bot)
+
+    async def play_round(self, game):
+        '''
+        Async counterpart of Game.play_round. Returns True once the game
+        is over, since a coroutine can't raise StopIteration.
+        '''
+        m, requests = game.begin_round()
+        strategies = []
+        remote = {}
+        for i, (p, args) in enumerate(zip(game.players, requests)):
+            if isinstance(p.player, RemotePlayer):
+                remote[i] = p.player.request_hunt_choices(*args)
+                strategies.append(None)
+            else:
+                strategies.append(game.hunt_choices(i, p, *args))
+        for i, decisions in zip(remote, await asyncio.gather(*remote.values())):
+            strategies[i] = decisions
+        try:
+            game.finish_round(m, strategies)
+        except StopIteration:
+            return True
+        return False
+
+    async def play_game(self, game):
+        '''Async counterpart of Game.play_game'''
+        remote = [p.player for p in game.players if isinstance(p.player, RemotePlayer)]
+        try:
+            while not (await self.play_round(game)):
+                pass
+        except BaseException:
+            for player in remote:
+                player.close(wait=False)
+            raise
+        await asyncio.gather(*(player.close() for player in remote))
+        game.announce_results()
+        return game
+
+    async def play_games(self, games, return_exceptions=False):
+        '''
+        Runs every game concurrently; requests are batched per client.
+
+        If a game fails (say a remote bot sends garbage or disconnects) the
+        other games are cancelled and the error is raised. With
+        return_exceptions=True the other games play on instead, and the
+        failed game's exception is returned in its place in the results.
+        '''
+        tasks = [asyncio.ensure_future(self.play_game(game)) for game in games]
+        if return_exceptions:
+            return await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class LocalClient(object):
+    '''
+    LocalClient(bots)
+
+    Client that plays ordinary bots over the network, so the whole protocol
+    can be exercised on one machine. bots maps the name the server will ask
+    for to a class or factory returning a fresh BasePlayer, eg.
+
+        LocalClient({'Pushover': Pushover, 'Random0.5': lambda: Random(.5)})
+
+    Every seat gets its own instance, so stateful bots behave exactly as
+    they would in a local Game. A bot that raises breaks only its own seat:
+    it isn't called again, and the seat's next request gets the error.
+    '''
+    def __init__(self, bots):
+        self.bots = bots
+        self.seats = {}
+        self.errors = {}
+
+    async def run(self, host, port):
+        '''Connects to a Server and serves requests until it disconnects.'''
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(encode([{'op': 'hello', 'bots': sorted(self.bots)}]))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                replies = [r for r in map(self.handle, decode(line)) if r is not None]
+                if replies:
+                    writer.write(encode(replies))
+                    await writer.drain()
+        finally:
+            writer.close()
+
+    def handle(self, message):
+        op, seat = message['op'], message['seat']
+        result = None
+        if seat not in self.errors:
+            try:
+                if op == 'new':
+                    self.seats[seat] = self.bots[message['bot']]()
+                elif op == 'hunt_choices':
+                    result = list(self.seats[seat].hunt_choices(*message['args']))
+                elif op != 'close':
+                    getattr(self.seats[seat], op)(*message['args'])
+            except Exception as e:
+                self.errors[seat] = repr(e)
+        if op == 'close':
+            self.seats.pop(seat, None)
+            error = self.errors.pop(seat, None)
+        else:
+            error = self.errors.get(seat)
+        if 'id' not in message:
+            return None
+        if error is not None:
+            return {'id': message['id'], 'error': error}
+        return {'id': message['id'], 'result': result}
@@ -0,0 +1,287 @@
+from __future__ import division, print_function
+from array import array
+import hashlib
+import json
+import os
+
+# On-disk store for the results of many games, so batch runs and
+# tournaments can be analysed afterwards instead of scrolling through
+# printed output. Standard library only.
+#
+# Layout of a store directory:
+#   store.json          number of games, the chunk list and the bot names
+#   chunk-000000.col    one column after another, raw typed arrays
+#   chunk-000000.json   where each column starts, plus the group index
+#
+# There is one row per bot per game. Within a chunk the rows are sorted by
+# the indexed columns (INDEX below), and the chunk's index records the row
+# range of every distinct combination. Queries filter and group on those
+# columns using the indexes alone, then read just the slices of the
+# columns they need, so nothing is ever loaded whole.
+
+COLUMNS = [
+    ('game', 'q'),
+    ('roster', 'q'),
+    ('seed', 'q'),
+    ('bot', 'i'),
+    ('field_size', 'i'),
+    ('min_rounds', 'i'),
+    ('average_rounds', 'i'),
+    ('end_early', 'b'),
+    ('rounds', 'i'),
+    ('food', 'q'),
+    ('eliminated', 'i'),
+    ('rank', 'i'),
+    ('won', 'b'),
+]
+
+INDEX = ['bot', 'field_size', 'min_rounds', 'average_rounds', 'end_early']
+
+DEFAULT_CHUNK_ROWS = 65536
+
+
+def roster_hash(names):
+    '''Stable 64-bit id for a roster, regardless of seating order'''
+    digest = hashlib.sha1('\n'.join(sorted(names)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+def seed_value(seed):
+    '''
+    Seeds go in a 64-bit column: -1 for no seed, ints as they are, and
+    anything else random.Random accepts (strings, big ints...) hashed.
+    '''
+    if seed is None:
+        return -1
+    if isinstance(seed, int) and -2**63 <= seed < 2**63:
+        return seed
+    digest = hashlib.sha1(repr(seed).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+def bot_name(player):
+    '''Players without a name (like Player) are filed under their class'''
+    return getattr(player, 'name', type(player).__name__)
+
+
+def rank_players(game):
+    '''
+    Ranks game.roster from 1 (the winner, as announced by play_game) down.
+    Survivors come first by food, then the starved, latest elimination first.
+    '''
+    return sorted(game.roster, key=lambda p: (p.eliminated is None, p.eliminated or 0, p.food),
+                  reverse=True)
+
+
+class ResultsStore(object):
+    '''
+    ResultsStore(path, chunk_rows=65536)
+
+    Appends a summary of each finished Game to the store at path (a
+    directory, created if needed) and answers aggregate queries over them.
+
+        with ResultsStore('results') as store:
+            for seed in range(1000):
+                game = Game(make_players(), verbose=False, seed=seed)
+                game.play_game()
+                store.append(game)
+            store.win_rate('Player', by='field_size', average_rounds=1000)
+
+    Rows are buffered and written chunk_rows at a time; close() (or leaving
+    the with block) writes the remainder. Queries only see written chunks,
+    so call flush() first to include buffered rows.
+
+    Filters and groupings are limited to the indexed columns in INDEX;
+    bot is given by name.
+    '''
+    def __init__(self, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        try:
+            with open(self.file('store.json')) as f:
+                meta = json.load(f)
+        except IOError:
+            meta = {'games': 0, 'chunks': [], 'bots': []}
+        self.games = meta['games']
+        self.chunks = meta['chunks']
+        self.bots = meta['bots']
+        self.bot_ids = dict((name, i) for i, name in enumerate(self.bots))
+        self.indexes = [self.load_index(chunk) for chunk in self.chunks]
+        self.buffer = dict((name, array(code)) for name, code in COLUMNS)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def load_index(self, chunk):
+        with open(self.file(chunk + '.json')) as f:
+            return json.load(f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.flush()
+
+    def append(self, game):
+        '''
+        Records a finished Game, one row per player in its roster. The rows
+        are checked against the column types before anything is stored, so
+        a bad value raises without leaving the columns out of step.
+        '''
+        names = [bot_name(p.player) for p in game.roster]
+        game_row = {
+            'game': self.games,
+            'roster': roster_hash(names),
+            'seed': seed_value(game.seed),
+            'field_size': len(game.roster),
+            'min_rounds': game.min_rounds,
+            'average_rounds': game.average_rounds,
+            'end_early': int(game.end_early),
+            'rounds': game.round,
+        }
+        # New bots only get registered once the rows are known to be good
+        new_bots = []
+        rows = []
+        for rank, p in enumerate(rank_players(game), 1):
+            name = bot_name(p.player)
+            if name not in self.bot_ids and name not in new_bots:
+                new_bots.append(name)
+            bot = self.bot_ids[name] if name in self.bot_ids else len(self.bots) + new_bots.index(name)
+            rows.append(dict(game_row,
+                             bot=bot,
+                             food=p.food,
+                             eliminated=-1 if p.eliminated is None else p.eliminated,
+                             rank=rank,
+                             won=int(rank == 1 and p.eliminated is None)))
+        columns = dict((name, array(code, [row[name] for row in rows])) for name, code in COLUMNS)
+
+        for name in new_bots:
+            self.bot_ids[name] = len(self.bots)
+            self.bots.append(name)
+        for name, _ in COLUMNS:
+            self.buffer[name].extend(columns[name])
+        self.games += 1
+        if len(self.buffer['game']) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        rows = len(self.buffer['game'])
+        if rows:
+            self.write_chunk(rows)
+            self.buffer = dict((name, array(code)) for name, code in COLUMNS)
+        self.write_meta()
+
+    def write_chunk(self, rows):
+        chunk = 'chunk-{:06d}'.format(len(self.chunks))
+        keys = list(zip(*(self.buffer[name] for name in INDEX)))
+        order = sorted(range(rows), key=keys.__getitem__)
+
+        groups = []
+        for i, row in enumerate(order):
+            if groups and groups[-1][:-2] == list(keys[row]):
+                groups[-1][-1] = i + 1
+            else:
+                groups.append(list(keys[row]) + [i, i + 1])
+
+        columns = {}
+        offset = 0
+        with open(self.file(chunk + '.col'), 'wb') as f:
+            for name, code in COLUMNS:
+                column = self.buffer[name]
+                data = array(code, map(column.__getitem__, order))
+                data.tofile(f)
+                columns[name] = [code, offset]
+                offset += len(data)*data.itemsize
+
+        index = {'rows': rows, 'columns': columns, 'groups': groups}
+        with open(self.file(chunk + '.json'), 'w') as f:
+            json.dump(index, f)
+        self.chunks.append(chunk)
+        self.indexes.append(index)
+
+    def write_meta(self):
+        # Write then rename, so a crash never leaves a half-written store.json
+        meta = {'games': self.games, 'chunks': self.chunks, 'bots': self.bots}
+        with open(self.file('store.json.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(self.file('store.json.tmp'), self.file('store.json'))
+
+    def __len__(self):
+        return sum(index['rows'] for index in self.indexes)
+
+    def match(self, where):
+        '''Turns keyword filters into (position in INDEX, value) pairs'''
+        conditions = []
+        for name, value in where.items():
+            if name not in INDEX:
+                raise ValueError("can only filter on {}, not {}".format(', '.join(INDEX), name))
+            if name == 'bot':
+                value = self.bot_ids.get(value, -1)
+            conditions.append((INDEX.index(name), value))
+        return conditions
+
+    def select(self, columns, **where):
+        '''
+        select(columns, **where)
+
+        Yields (key, data) for every group of rows matching where, where
+        key maps the INDEX columns to the group's values and data maps each
+        requested column to an array of that group's rows.
+        '''
+        conditions = self.match(where)
+        for chunk, index in zip(self.chunks, self.indexes):
+            groups = [g for g in index['groups'] if all(g[i] == v for i, v in conditions)]
+            if not groups:
+                continue
+            with open(self.file(chunk + '.col'), 'rb') as f:
+                for group in groups:
+                    start, end = group[-2:]
+                    data = {}
+                    for name in columns:
+                        code, offset = index['columns'][name]
+                        column = array(code)
+                        f.seek(offset + start*column.itemsize)
+                        column.fromfile(f, end - start)
+                        data[name] = column
+                    key = dict(zip(INDEX, group))
+                    key['bot'] = self.bots[key['bot']]
+                    yield key, data
+
+    def aggregate(self, column, by=None, **where):
+        '''
+        aggregate(column, by=None, **where)
+
+        Returns {value of by: (rows, sum of column)} over the rows matching
+        where, or a single (rows, sum) pair if by is None.
+        '''
+        if by is not None and by not in INDEX:
+            raise ValueError("can only group by {}, not {}".format(', '.join(INDEX), by))
+        totals = {}
+        for key, data in self.select([column], **where):
+            group = key[by] if by is not None else None
+            count, total = totals.get(group, (0, 0))
+            totals[group] = (count + len(data[column]), total + sum(data[column]))
+        if by is None:
+            return totals.get(None, (0, 0))
+        return totals
+
+    def win_rate(self, bot, by=None, **where):
+        '''Fraction of bot's games it won, overall or {value of by: rate}'''
+        totals = self.aggregate('won', by, bot=bot, **where)
+        if by is None:
+            count, wins = totals
+            return wins/count if count else 0
+        return dict((group, wins/count) for group, (count, wins) in totals.items())
+
+    def mean(self, column, by=None, **where):
+        '''Mean of column, overall or {value of by: mean}'''
+        totals = self.aggregate(column, by, **where)
+        if by is None:
+            count, total = totals
+            return total/count if count else 0
+        return dict((group, total/count) for group, (count, total) in totals.items())
@@ -1,7 +1,17 @@
+from __future__ import division
+import asyncio
+import math
+import shutil
+import tempfile
 import unittest
 from bots import *
 from Player import BasePlayer
 from Game import Game
+from memo import DecisionCache
+from network import Server, LocalClient, RemoteError
+from history import RingBuffer
+from meanfield import MeanFieldGame, validate
+from results import ResultsStore
 
 # Unit tests to safeguard against rebreaking things.
 # If you don't know what this is, ignore it.
@@ -142,6 +152,494 @@ class TestTwoPlayer(unittest.TestCase):
         self.assertEqual(self.game.m_bonus, 2)
         
 
+class TestSeed(unittest.TestCase):
+    def play(self, *games):
+        # Takes turns playing a round of each game until they are all over
+        running = list(games)
+        while running:
+            for game in list(running):
+                try:
+                    game.play_round()
+                except StopIteration:
+                    running.remove(game)
+                    
+    def test_interleaved_games_replay(self):
+        def make_game(seed):
+            return Game([Pushover(), Freeloader(), Alternator()], verbose=False,
+                        min_rounds=5, average_rounds=15, seed=seed)
+        alone = make_game(3)
+        self.play(alone)
+        replay, other = make_game(3), make_game(None)
+        self.play(replay, other)
+        self.assertEqual(replay.round, alone.round)
+        self.assertEqual(list(replay.history.m), list(alone.history.m))
+        self.assertEqual([p.food for p in replay.roster], [p.food for p in alone.roster])
+        
+
+# The built-in bots don't declare themselves pure, since the cache only
+# pays off for expensive strategies, so the tests declare their own.
+class PureMaxRepHunter(MaxRepHunter):
+    pure = True
+    
+    
+class PurePushover(Pushover):
+    pure = True
+    
+    
+class PureFreeloader(Freeloader):
+    pure = True
+    
+    
+class PureBoundedHunter(BoundedHunter):
+    pure = True
+    
+    def decision_key(self):
+        return (type(self), self.low, self.up)
+        
+        
+class StatefulPushover(PurePushover):
+    '''Subclass with state of its own, so it must not inherit purity'''
+    def __init__(self):
+        Pushover.__init__(self)
+        self.calls = 0
+        
+    def hunt_choices(self, *args):
+        self.calls += 1
+        return Pushover.hunt_choices(self, *args)
+        
+        
+class TestDecisionCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = DecisionCache(max_entries=2)
+        
+    def choices(self, decisions, i, bot, reputations):
+        opponents = reputations[:i] + reputations[i+1:]
+        return decisions.hunt_choices(i, bot, 1, 1200, reputations[i], 3, opponents)
+        
+    def test_identical_bots_share_one_computation(self):
+        reputations = [0.5, 0.2, 0.9, 0.5, 0.5, 0.9]
+        decisions = self.cache.round(reputations)
+        for i in (0, 3, 4):
+            bot = PureMaxRepHunter()
+            opponents = reputations[:i] + reputations[i+1:]
+            self.assertEqual(bot.hunt_choices(1, 1200, 0.5, 3, opponents),
+                             self.choices(decisions, i, bot, reputations))
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+        
+    def test_shared_across_rounds_in_any_order(self):
+        self.choices(self.cache.round([0.2, 0.5, 0.9]), 1, PureMaxRepHunter(), [0.2, 0.5, 0.9])
+        self.assertEqual(['h', 's'],
+            self.choices(self.cache.round([0.9, 0.2, 0.5]), 2, PureMaxRepHunter(), [0.9, 0.2, 0.5]))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        
+    def test_returned_list_is_a_copy(self):
+        decisions = self.cache.round([0, 0, 0])
+        self.choices(decisions, 0, PurePushover(), [0, 0, 0]).insert(0, 's')
+        self.assertEqual(['h', 'h'], self.choices(decisions, 1, PurePushover(), [0, 0, 0]))
+            
+    def test_impure_bots_bypass_cache(self):
+        self.choices(self.cache.round([0, 0, 0]), 0, Alternator(), [0, 0, 0])
+        self.assertEqual(len(self.cache), 0)
+        
+    def test_purity_is_not_inherited(self):
+        decisions = self.cache.round([0, 0, 0])
+        bots = [StatefulPushover(), StatefulPushover()]
+        for i, bot in enumerate(bots):
+            self.choices(decisions, i, bot, [0, 0, 0])
+        self.assertEqual([bot.calls for bot in bots], [1, 1])
+        self.assertEqual(len(self.cache), 0)
+        
+    def test_decision_key_separates_parameters(self):
+        decisions = self.cache.round([0.5, 0.1, 0.5])
+        self.assertEqual(['s', 'h'],
+            self.choices(decisions, 0, PureBoundedHunter(0.4, 0.6), [0.5, 0.1, 0.5]))
+        self.assertEqual(['h', 'h'],
+            self.choices(decisions, 2, PureBoundedHunter(0, 1), [0.5, 0.1, 0.5]))
+            
+    def test_lru_eviction(self):
+        for n in range(2, 5):
+            self.choices(self.cache.round([0]*n), 0, PureFreeloader(), [0]*n)
+        self.assertEqual(len(self.cache), 2)
+        
+    def test_quantized_reputations(self):
+        bot = PureMaxRepHunter()
+        bot.quantum = 0.1
+        self.assertEqual(['h', 'h'],
+            self.choices(self.cache.round([0.5, 0.51, 0.49]), 0, bot, [0.5, 0.51, 0.49]))
+        self.choices(self.cache.round([0.5, 0.52, 0.48]), 0, bot, [0.5, 0.52, 0.48])
+        self.assertEqual(self.cache.hits, 1)
+        
+    def test_memoized_game_matches_plain_game(self):
+        def play(memoize):
+            players = [PureMaxRepHunter(), PureMaxRepHunter(), PureBoundedHunter(0.3, 0.7),
+                       PureBoundedHunter(0.3, 0.7), PurePushover(), PureFreeloader()]
+            game = Game(players, verbose=False, memoize=memoize, seed=5)
+            for _ in range(20):
+                game.play_round()
+            return [p.food for p in game.roster]
+        self.assertEqual(play(False), play(True))
+        
+        
+class TestRingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = RingBuffer('l', 3)
+        
+    def test_wraps_around(self):
+        for value in range(5):
+            self.buffer.append(value)
+        self.assertEqual(len(self.buffer), 3)
+        self.assertEqual(list(self.buffer), [2, 3, 4])
+        self.assertEqual(list(self.buffer.last(2)), [3, 4])
+        self.assertEqual(self.buffer[-1], 4)
+        self.assertEqual(self.buffer.mean(), 3)
+        
+    def test_windows_are_read_only(self):
+        self.buffer.append(1)
+        self.assertRaises(TypeError, self.buffer.last().__setitem__, 0, 2)
+        
+    def test_empty(self):
+        self.assertEqual(len(self.buffer.last(10)), 0)
+        self.assertEqual(self.buffer.mean(), 0)
+        
+    def test_negative_window(self):
+        self.assertRaises(ValueError, self.buffer.last, -1)
+        
+        
+class TamperBot(Pushover):
+    '''Bot that tries every way it can to rewrite the shared history'''
+    def hunt_choices(self, *args):
+        history = self.history
+        attempts = [
+            lambda: history.awards.append(999),
+            lambda: history.awards.data.__setitem__(0, 999),
+            lambda: history.m.last().__setitem__(0, 7),
+            lambda: history.awards.last().obj.__setitem__(0, 999),
+            lambda: history.awards[-1:].obj.__setitem__(0, 999),
+            lambda: history.awards._buffer.append(999),
+            lambda: history.awards.game_history.record(999, 7, 7),
+            lambda: history.record(999, 7),
+            lambda: setattr(history.awards, 'extra', 1),
+        ]
+        for attempt in attempts:
+            try:
+                attempt()
+            except (AttributeError, TypeError, IndexError):
+                pass
+        return Pushover.hunt_choices(self, *args)
+
+
+class HistoryKeeper(Pushover):
+    '''Bot that keeps its own history the old way'''
+    def __init__(self):
+        self.history = []
+
+    def round_end(self, award, m, number_hunters):
+        self.history.append(award)
+        
+        
+class TestHistory(unittest.TestCase):
+    def test_two_player_history(self):
+        players = [FakePlayer(), FakePlayer()]
+        game = Game(players, verbose=False, history_rounds=2)
+        for _ in range(3):
+            game.play_round()
+        history = players[0].history
+        self.assertEqual(list(history.awards), [2, 2])
+        self.assertEqual(list(history.m), [1, 1])
+        self.assertEqual(list(history.number_hunters), [2, 2])
+        self.assertEqual(list(history.earnings), [0, 0])
+        self.assertEqual(list(history.hunts), [1, 1])
+        # The public buffers are shared, not copied per player
+        self.assertEqual(list(history.m), list(players[1].history.m))
+        
+    def test_bots_cannot_rewrite_history(self):
+        pushover = Pushover()
+        game = Game([TamperBot(), pushover], verbose=False)
+        for _ in range(3):
+            game.play_round()
+        self.assertEqual(list(pushover.history.awards), [2, 2, 2])
+        self.assertEqual(list(pushover.history.m), [1, 1, 1])
+        
+    def test_own_history_is_kept(self):
+        keeper = HistoryKeeper()
+        game = Game([keeper, Pushover()], verbose=False)
+        for _ in range(3):
+            game.play_round()
+        self.assertEqual(keeper.history, [2, 2, 2])
+        
+        
+class TestMeanField(unittest.TestCase):
+    def test_deterministic_roster_is_exact(self):
+        # With two players m is always 1, so nothing is left to chance
+        approx = MeanFieldGame([Pushover(), Freeloader()])
+        exact = Game([Pushover(), Freeloader()], verbose=False)
+        approx.play_game(20)
+        for _ in range(20):
+            exact.play_round()
+        self.assertEqual(sorted(p.food for p in approx.roster),
+                         sorted(p.food for p in exact.players))
+        
+    def test_bonus_probability(self):
+        # 4 hunts succeed for m in 1..4 out of 1..5
+        approx = MeanFieldGame([Pushover(), Freeloader(), Pushover()])
+        approx.play_round()
+        self.assertAlmostEqual(approx.bonus_trajectory[0], 4/5)
+        
+    def test_two_player_bonus_probability(self):
+        approx = MeanFieldGame([Random(.5), Random(.2)])
+        approx.play_round()
+        self.assertAlmostEqual(approx.bonus_trajectory[0], 1 - .5*.8)
+        
+    def test_elimination(self):
+        approx = MeanFieldGame([Pushover(), Freeloader(), Freeloader()])
+        approx.play_game()
+        self.assertEqual(approx.roster[0].survival, 0.0)
+        self.assertIsNotNone(approx.roster[0].eliminated)
+        self.assertEqual(len(approx.roster[0].food_trajectory), approx.roster[0].eliminated)
+        
+    def test_game_length_distribution(self):
+        approx = MeanFieldGame([Random(.5), Random(.5)], min_rounds=10, average_rounds=20)
+        approx.play_game()
+        # Game always plays min_rounds+1 rounds, then each further round
+        # with probability exp(-1/(average_rounds-min_rounds))
+        self.assertEqual(approx.still_playing(11), 1.0)
+        self.assertAlmostEqual(approx.still_playing(12), math.exp(-0.1))
+        weights = approx.end_weights()
+        self.assertEqual(sum(weights[:10]), 0)
+        self.assertAlmostEqual(sum(weights), 1)
+        self.assertLess(approx.still_playing(approx.round + 1), 1e-2)
+        
+    def test_fixed_length(self):
+        approx = MeanFieldGame([Random(.5), Random(.5)])
+        approx.play_game(rounds=40)
+        self.assertEqual(approx.round, 40)
+        self.assertEqual(approx.end_weights()[-1], 1)
+        self.assertEqual(approx.roster[0].expected_food, approx.roster[0].food)
+        
+    def test_identical_players_share_a_group(self):
+        class Ungrouped(Random):
+            # Defining its own model keeps each instance in a group of its own
+            def hunt_probability(self, rep, avg):
+                return self.p_hunt
+        def roster(random):
+            return [random(.5), random(.5), random(.8), FairHunter(), FairHunter(),
+                    BoundedHunter(.3, .7), Freeloader()]
+        grouped = MeanFieldGame(roster(Random), min_rounds=20, average_rounds=40)
+        separate = MeanFieldGame(roster(Ungrouped), min_rounds=20, average_rounds=40)
+        self.assertEqual(len(grouped.groups), 5)
+        self.assertEqual(len(separate.groups), 6)
+        grouped.play_game()
+        separate.play_game()
+        self.assertEqual(grouped.round, separate.round)
+        for a, b in zip(grouped.roster, separate.roster):
+            self.assertAlmostEqual(a.expected_food, b.expected_food)
+            self.assertAlmostEqual(a.survival, b.survival)
+        self.assertIs(grouped.roster[0].food_trajectory, grouped.roster[1].food_trajectory)
+        
+    def test_unsupported_player(self):
+        self.assertRaises(ValueError, MeanFieldGame, [MaxRepHunter(), Pushover()])
+        
+    def test_validate(self):
+        report = validate(lambda: [Random(.5), FairHunter()],
+                          games=20, rounds=50, verbose=False)
+        self.assertEqual(len(report['players']), 2)
+        self.assertLess(report['food_drift'], 0.1)
+        
+    def test_validate_random_length(self):
+        report = validate(lambda: [Random(.5), FairHunter()], games=20,
+                          min_rounds=20, average_rounds=40, verbose=False)
+        self.assertLess(report['food_drift'], 0.15)
+        
+        
+class TestResultsStore(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        
+    def play(self, store, players, **options):
+        game = Game(players, verbose=False, min_rounds=5, average_rounds=10, **options)
+        game.play_game()
+        store.append(game)
+        return game
+        
+    def test_win_rate(self):
+        # Freeloader always beats Pushover head to head
+        with ResultsStore(self.path, chunk_rows=4) as store:
+            for seed in range(3):
+                self.play(store, [Pushover(), Freeloader()], seed=seed)
+            self.play(store, [Pushover(), Freeloader(), Freeloader()], seed=3)
+        store = ResultsStore(self.path)
+        self.assertEqual(len(store), 9)
+        self.assertEqual(store.games, 4)
+        self.assertEqual(store.win_rate('Freeloader', by='field_size'), {2: 1.0, 3: 0.5})
+        self.assertEqual(store.win_rate('Pushover'), 0)
+        self.assertEqual(store.win_rate('Player'), 0)
+        
+    def test_columns(self):
+        with ResultsStore(self.path) as store:
+            game = self.play(store, [Pushover(), Freeloader()], seed=7)
+        (key, data), = ResultsStore(self.path).select(
+            ['seed', 'rounds', 'food', 'rank', 'eliminated'], bot='Pushover', average_rounds=10)
+        self.assertEqual(key['field_size'], 2)
+        self.assertEqual(list(data['seed']), [7])
+        self.assertEqual(list(data['rounds']), [game.round])
+        self.assertEqual(list(data['rank']), [2])
+        self.assertEqual(list(data['eliminated']), [-1])
+        self.assertEqual(store.mean('food', bot='Pushover'), data['food'][0])
+        
+    def test_non_integer_seed(self):
+        with ResultsStore(self.path) as store:
+            self.play(store, [Pushover(), Freeloader()], seed='run-1')
+            self.play(store, [Pushover(), Freeloader()], seed='run-1')
+        seeds = [list(data['seed']) for _, data in ResultsStore(self.path).select(['seed'], bot='Pushover')]
+        self.assertEqual(len(seeds[0]), 2)
+        self.assertEqual(seeds[0][0], seeds[0][1])
+        self.assertNotEqual(seeds[0][0], -1)
+        
+    def test_bad_row_leaves_store_consistent(self):
+        store = ResultsStore(self.path)
+        game = Game([Pushover(), Freeloader()], verbose=False)
+        game.roster[0].food = 2**70
+        self.assertRaises(OverflowError, store.append, game)
+        self.assertEqual(store.games, 0)
+        self.assertEqual(store.bots, [])
+        self.assertEqual(set(len(column) for column in store.buffer.values()), {0})
+        self.play(store, [Pushover(), Freeloader()], seed=1)
+        store.close()
+        (key, data), = ResultsStore(self.path).select(['game', 'seed'], bot='Freeloader')
+        self.assertEqual((list(data['game']), list(data['seed'])), ([0], [1]))
+        
+    def test_unindexed_filter(self):
+        store = ResultsStore(self.path)
+        self.assertRaises(ValueError, store.win_rate, 'Pushover', food=10)
+        
+        
+class BadBot(BasePlayer):
+    '''Bot that ignores the rules about what hunt_choices returns'''
+    def hunt_choices(self, *args):
+        return ['x']
+
+
+class CrashingBot(Pushover):
+    '''Pushover that raises in round_end, once it has played a few rounds'''
+    def __init__(self, crash_round=3):
+        self.crash_round = crash_round
+        self.rounds = 0
+
+    def round_end(self, award, m, number_hunters):
+        self.rounds += 1
+        if self.rounds == self.crash_round:
+            raise ValueError("crashed in round_end")
+        
+        
+class TestNetwork(unittest.TestCase):
+    def run_games(self, bots, make_games, play=None, **options):
+        async def main():
+            server = Server()
+            await server.start()
+            client = LocalClient(bots)
+            task = asyncio.ensure_future(client.run(server.host, server.port))
+            await server.wait_for_bots(list(bots))
+            try:
+                if play is not None:
+                    return await play(server, make_games)
+                games = await server.play_games(make_games(server), **options)
+                connection = server.connections[0]
+                return games, connection.writes, connection.messages
+            finally:
+                await server.close()
+                await task
+                self.assertEqual(client.seats, {})
+        return asyncio.run(main())
+        
+    def test_concurrent_games(self):
+        def make_games(server):
+            return [Game([server.remote_player('Pushover'),
+                          server.remote_player('Alternator'),
+                          Freeloader()],
+                         verbose=False, min_rounds=5, average_rounds=10)
+                    for _ in range(5)]
+        games, writes, messages = self.run_games(
+            {'Pushover': Pushover, 'Alternator': Alternator}, make_games)
+        for game in games:
+            self.assertTrue(game.P < 2 or game.round > game.max_rounds)
+        # Messages from all five games should have shared socket writes
+        self.assertLess(writes*5, messages)
+        
+    def test_remote_matches_local(self):
+        # Pushover and Freeloader are deterministic, so both engines
+        # must end up with the same food totals
+        def make_games(server):
+            return [Game([server.remote_player('Pushover'), Freeloader()],
+                         verbose=False, min_rounds=5, average_rounds=10)]
+        (remote,), _, _ = self.run_games({'Pushover': Pushover}, make_games)
+        local = Game([Pushover(), Freeloader()], verbose=False)
+        for _ in range(remote.round):
+            try:
+                local.play_round()
+            except StopIteration:
+                pass
+        self.assertEqual(sorted(p.food for p in remote.players),
+                         sorted(p.food for p in local.players))
+        
+    def test_invalid_decisions(self):
+        def make_games(server):
+            return [Game([server.remote_player('BadBot'), Freeloader()], verbose=False)]
+        self.assertRaises(RemoteError, self.run_games, {'BadBot': BadBot}, make_games)
+        
+    def mixed_games(self, games):
+        def make_games(server):
+            games.append(Game([server.remote_player('BadBot'), Freeloader()], verbose=False))
+            games.extend(Game([server.remote_player('Pushover'), Freeloader()],
+                              verbose=False, min_rounds=50, average_rounds=60)
+                         for _ in range(3))
+            return games
+        return make_games
+        
+    def test_failure_cancels_other_games(self):
+        games = []
+        async def play_and_wait(server, make_games):
+            try:
+                await server.play_games(make_games(server))
+            except RemoteError:
+                rounds = [game.round for game in games]
+                await asyncio.sleep(0.05)
+                # Nothing kept playing after play_games gave up
+                self.assertEqual(rounds, [game.round for game in games])
+                raise
+        self.assertRaises(RemoteError, self.run_games, {'BadBot': BadBot, 'Pushover': Pushover},
+                          self.mixed_games(games), play=play_and_wait)
+        
+    def test_return_exceptions(self):
+        bots = {'BadBot': BadBot, 'Pushover': Pushover}
+        results, _, _ = self.run_games(bots, self.mixed_games([]), return_exceptions=True)
+        self.assertIsInstance(results[0], RemoteError)
+        for game in results[1:]:
+            self.assertTrue(game.P < 2 or game.round > game.max_rounds)
+
+    def test_bot_errors_fail_only_their_game(self):
+        def broken_init():
+            raise ValueError("crashed in __init__")
+        bots = {'Crasher': CrashingBot, 'BrokenInit': broken_init, 'Pushover': Pushover,
+                'LastRound': lambda: CrashingBot(crash_round=1)}
+        def make_games(server):
+            games = [Game([server.remote_player(bot), Freeloader()], verbose=False,
+                          min_rounds=5, average_rounds=6)
+                     for bot in ('Crasher', 'BrokenInit', 'LastRound', 'Pushover')]
+            # LastRound crashes after the game's only round, which only
+            # closing the seat can catch
+            games[2].max_rounds = 0
+            return games
+        results, _, _ = self.run_games(bots, make_games, return_exceptions=True)
+        self.assertIsInstance(results[0], RemoteError)
+        self.assertIn('round_end', str(results[0]))
+        self.assertIn('__init__', str(results[1]))
+        self.assertIn('round_end', str(results[2]))
+        self.assertTrue(results[3].round > results[3].max_rounds)
+        
+        
 if __name__ == '__main__':
     unittest.main()
     
\ No newline at end of file